@@ -4,21 +4,243 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
+import pyarrow.ipc
 from langchain_ollama import ChatOllama
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, MessagesState
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_core.messages import HumanMessage
+import functools
 import os
 import tempfile
+import threading
+import warnings
+from collections import OrderedDict
 
 # Инициализация модели
 llm = ChatOllama(
     model="llama3.1:8b",
     temperature=0,
-    num_predict=250  
+    num_predict=250,
+    keep_alive=-1  # модель остаётся загруженной в Ollama между запросами
 )
 
+# Кэш прочитанных файлов: ключ — (путь, mtime, размер, usecols), поэтому изменённый файл перечитывается.
+# usecols (кортеж имён) ограничивает чтение нужными столбцами. Если полный DataFrame того же файла
+# уже в кэше, узкий запрос берёт столбцы из него без повторного чтения, поэтому нужен свой
+# OrderedDict: в lru_cache нельзя заглянуть по другому ключу.
+# DataFrame из кэша общий для всех инструментов — не изменять его на месте.
+_FRAME_CACHE_SIZE = 8
+_frame_cache = OrderedDict()
+_frame_cache_lock = threading.Lock()  # Streamlit выполняет сессии в разных потоках
+
+def _cache_get(key):
+    with _frame_cache_lock:
+        df = _frame_cache.get(key)
+        if df is not None:
+            _frame_cache.move_to_end(key)
+        return df
+
+def _cache_put(key, df):
+    with _frame_cache_lock:
+        _frame_cache[key] = df
+        _frame_cache.move_to_end(key)
+        while len(_frame_cache) > _FRAME_CACHE_SIZE:
+            _frame_cache.popitem(last=False)
+
+# Удаляет из кэша все DataFrame файла (любой версии и любого набора столбцов) — для удаляемых временных файлов
+def forget_file(path):
+    with _frame_cache_lock:
+        for key in [key for key in _frame_cache if key[0] == path]:
+            del _frame_cache[key]
+
+def _load_df(path, usecols=None):
+    columns = list(usecols) if usecols else None
+    if path.endswith('.feather'):
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns, encoding_errors='replace')
+    return _compact_dtypes(df)
+
+# Только имена столбцов: для CSV читается заголовок, для Feather — схема из конца файла
+@functools.lru_cache(maxsize=8)
+def _load_header(path, mtime, size):
+    if path.endswith('.feather'):
+        with pyarrow.ipc.open_file(path) as reader:
+            return tuple(reader.schema.names)
+    return tuple(pd.read_csv(path, nrows=0, encoding_errors='replace').columns)
+
+# Уменьшаем типы: целые — до самого узкого целого типа (без потери значений),
+# строковые столбцы с небольшим числом уникальных значений — в category.
+# Дробные столбцы остаются float64: float32 меняет выводимые значения (превью, describe_data);
+# до float32 приводят только массивы внутри численных расчётов (см. _corr_with)
+def _compact_dtypes(df):
+    for col in df.select_dtypes(include=['integer']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in df.select_dtypes(include=['object']).columns:
+        if df[col].nunique() < 0.05 * len(df):
+            df[col] = df[col].astype('category')
+    return df
+
+def load_dataframe(path, usecols=None):
+    stat = os.stat(path)
+    file_key = (path, stat.st_mtime_ns, stat.st_size)
+    df = _cache_get(file_key + (usecols,))
+    if df is not None:
+        return df
+    if usecols:
+        full = _cache_get(file_key + (None,))
+        if full is not None:
+            return full[list(usecols)]
+    df = _load_df(path, usecols)
+    _cache_put(file_key + (usecols,), df)
+    return df
+
+def _sniff_columns(path):
+    stat = os.stat(path)
+    return _load_header(path, stat.st_mtime_ns, stat.st_size)
+
+# Однократная конвертация CSV в Feather (Arrow IPC): дальше файл читается без разбора текста
+def csv_to_feather(path):
+    feather_path = os.path.splitext(path)[0] + '.feather'
+    # low_memory=False: тип столбца выводится по всему файлу, иначе Arrow не сохранит смешанные типы
+    df = pd.read_csv(path, encoding_errors='replace', low_memory=False)
+    try:
+        df.to_feather(feather_path)
+    except Exception:
+        if os.path.exists(feather_path):
+            os.unlink(feather_path)
+        raise
+    return feather_path
+
+# Гибкий поиск столбцов года основания и продаж (первое совпадение по имени).
+# Результат кэшируется по кортежу имён: повторные вызовы на том же файле не приводят имена к нижнему регистру заново
+@functools.lru_cache(maxsize=32)
+def _find_columns(columns):
+    lowered = [(str(col).lower(), col) for col in columns]
+    year_col = next((col for low, col in lowered if 'year' in low and 'establish' in low), None)
+    sales_col = next((col for low, col in lowered if 'sales' in low), None)
+    return year_col, sales_col
+
+# Границы IQR, число выбросов и позиции первых трёх выбросов за один вызов
+def _iqr_outlier_stats(values):
+    # Копия нужна, чтобы numpy мог частично сортировать её на месте
+    q1, q3 = np.quantile(values.copy(), [0.25, 0.75], method='linear', overwrite_input=True)
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+    mask = (values < lower_bound) | (values > upper_bound)
+    return lower_bound, upper_bound, int(np.count_nonzero(mask)), np.flatnonzero(mask)[:3]
+
+# Корреляция Пирсона каждого столбца X с y: центрирование во float64, скалярные произведения во float32.
+# Пропуски исключаются попарно, как в DataFrame.corrwith
+def _corr_with(X, y):
+    valid = ~(np.isnan(X) | np.isnan(y)[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if valid.all():
+            Xc = (X - X.mean(axis=0)).astype(np.float32)
+            yc = (y - y.mean()).astype(np.float32)
+            num = Xc.T @ yc
+            den = np.sqrt(np.einsum('ij,ij->j', Xc, Xc) * (yc @ yc))
+        else:
+            # У каждого столбца своё подмножество строк без пропусков
+            n = valid.sum(axis=0)
+            x_mean = np.where(valid, X, 0.0).sum(axis=0) / n
+            y_mean = np.where(valid, y[:, None], 0.0).sum(axis=0) / n
+            Xc = np.where(valid, X - x_mean, 0.0).astype(np.float32)
+            Yc = np.where(valid, y[:, None] - y_mean, 0.0).astype(np.float32)
+            num = np.einsum('ij,ij->j', Xc, Yc)
+            den = np.sqrt(np.einsum('ij,ij->j', Xc, Xc) * np.einsum('ij,ij->j', Yc, Yc))
+        return num / den
+
+# Потоковая статистика для describe_data: файл читается порциями, в памяти только порция и выборка
+_CHUNK_SIZE = 200_000
+# Квартили считаются по равномерной выборке строк; для файлов не длиннее выборки они точные
+_SAMPLE_SIZE = 100_000
+
+def _reservoir_update(sample, seen, rows, rng):
+    # Algorithm R по порциям: строка с номером j попадает в выборку с вероятностью k / (j + 1)
+    free = _SAMPLE_SIZE - len(sample)
+    if free > 0:
+        sample = np.vstack([sample, rows[:free]])
+        seen += min(free, len(rows))
+        rows = rows[free:]
+    if len(rows):
+        slots = rng.integers(0, np.arange(seen, seen + len(rows)) + 1)
+        keep = slots < _SAMPLE_SIZE
+        sample[slots[keep]] = rows[keep]
+    return sample
+
+# exact_quantiles=True — данные уже целиком в памяти: квартили по всем строкам, без выборки
+def _describe_chunks(chunks, exact_quantiles=False):
+    columns = None
+    n_rows = 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if columns is None:
+            columns = chunk.select_dtypes(include=['number']).columns
+            if columns.empty:
+                return None
+            count = np.zeros(len(columns))
+            mean = np.zeros(len(columns))
+            m2 = np.zeros(len(columns))
+            minimum = np.full(len(columns), np.nan)
+            maximum = np.full(len(columns), np.nan)
+            sample = np.empty((0, len(columns)))
+            rng = np.random.default_rng(0)
+        
+        # В следующих порциях числовой столбец может содержать текст — такие значения считаем пропусками
+        num = chunk[columns].apply(pd.to_numeric, errors='coerce')
+        # Все столбцы порции одной матрицей: каждая статистика — одна векторная редукция по оси строк
+        X = num.to_numpy(dtype=np.float64)
+        
+        with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+            # Столбец из одних пропусков даёт NaN вместо числа — ниже он обрабатывается явно
+            warnings.simplefilter('ignore', RuntimeWarning)
+            present = ~np.isnan(X)
+            chunk_count = np.count_nonzero(present, axis=0)
+            chunk_mean = np.where(chunk_count > 0, np.nansum(X, axis=0) / chunk_count, 0.0)
+            # inf в данных делает разброс неопределённым: M2 = NaN, как std в DataFrame.describe()
+            chunk_m2 = np.where(present, (X - chunk_mean) ** 2, 0.0).sum(axis=0)
+            chunk_m2 = np.where(np.isfinite(chunk_m2), chunk_m2, np.nan)
+            minimum = np.fmin(minimum, np.nanmin(X, axis=0))
+            maximum = np.fmax(maximum, np.nanmax(X, axis=0))
+            
+            # Объединение среднего и суммы квадратов отклонений по формулам Чана
+            total = count + chunk_count
+            delta = chunk_mean - mean
+            # Пустые столбцы получают 0 как заготовку; inf и NaN из самих данных сохраняются
+            mean = np.where(total > 0, (mean * count + chunk_mean * chunk_count) / total, 0.0)
+            m2 = np.where(total > 0, m2 + chunk_m2 + delta ** 2 * count * chunk_count / total, 0.0)
+        count = total
+        
+        if exact_quantiles:
+            sample = np.vstack([sample, X]) if len(sample) else X
+        else:
+            sample = _reservoir_update(sample, n_rows, X, rng)
+        n_rows += len(chunk)
+    
+    if columns is None:
+        return pd.DataFrame()
+    
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        # Столбец целиком из пропусков даёт NaN, как и в DataFrame.describe()
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quartiles = np.nanquantile(sample, [0.25, 0.5, 0.75], axis=0)
+        std = np.sqrt(np.where((count > 1) & np.isfinite(m2), m2 / (count - 1), np.nan))
+    
+    # Если строк больше, чем помещается в выборку, квартили — оценка; помечаем их «~»
+    quartile_labels = ['25%', '50%', '75%']
+    if n_rows > _SAMPLE_SIZE and not exact_quantiles:
+        quartile_labels = ['~' + label for label in quartile_labels]
+    
+    return pd.DataFrame(
+        np.vstack([count, np.where(count > 0, mean, np.nan), std, minimum, quartiles, maximum]),
+        index=['count', 'mean', 'std', 'min', *quartile_labels, 'max'],
+        columns=columns,
+    )
+
 # Инструмент: загрузка CSV
 @tool
 def load_csv(query: str) -> str:
@@ -36,7 +258,7 @@ def load_csv(query: str) -> str:
         if not query or not isinstance(query, str):
             return "Ошибка: пустой или некорректный путь к файлу"
         
-        df = pd.read_csv(query)
+        df = load_dataframe(query)
         if df.empty:
             return f"Ошибка: файл '{query}' пустой."
         
@@ -49,15 +271,6 @@ def load_csv(query: str) -> str:
         return f"Ошибка: файл '{query}' не найден. Проверь путь к файлу."
     except pd.errors.EmptyDataError:
         return f"Ошибка: файл '{query}' пустой или содержит только заголовки."
-    except UnicodeDecodeError:
-        try:
-            df = pd.read_csv(query, encoding='latin1')
-            num_rows = len(df)
-            num_cols = len(df.columns)
-            columns_str = ", ".join(df.columns.tolist())
-            return f"Загружено {num_rows} строк, {num_cols} столбцов (кодировка latin1). Столбцы: {columns_str}"
-        except Exception as e2:
-            return f"Ошибка кодировки: {e2}"
     except Exception as e:
         return f"Неизвестная ошибка при загрузке файла '{query}': {type(e).__name__} - {e}"
 
@@ -77,14 +290,26 @@ def describe_data(query: str) -> str:
         if not query or not isinstance(query, str):
             return "Ошибка: пустой или некорректный путь к файлу"
         
-        df = pd.read_csv(query)
-        if df.empty:
-            return f"Ошибка: файл '{query}' пустой."
-        
-        stats = df.describe()
-        if stats.empty:
+        if query.endswith('.feather'):
+            # Feather читается целиком без разбора текста, порции не нужны
+            stats = _describe_chunks([load_dataframe(query)], exact_quantiles=True)
+        else:
+            # Если файл уже разобран (например, load_csv), повторно текст не читаем
+            stat = os.stat(query)
+            full = _cache_get((query, stat.st_mtime_ns, stat.st_size, None))
+            if full is not None:
+                stats = _describe_chunks([full], exact_quantiles=True)
+            else:
+                with pd.read_csv(query, chunksize=_CHUNK_SIZE, encoding_errors='replace') as chunks:
+                    stats = _describe_chunks(chunks)
+        if stats is None:
             return f"Ошибка: в файле '{query}' нет числовых столбцов для анализа."
+        if stats.empty:
+            return f"Ошибка: файл '{query}' пустой."
         
+        if '~25%' in stats.index:
+            return (f"{stats.to_string()}\n\n"
+                    f"~ — квартили оценены по случайной выборке из {_SAMPLE_SIZE} строк.")
         return stats.to_string()
     
     except FileNotFoundError:
@@ -92,6 +317,9 @@ def describe_data(query: str) -> str:
     except Exception as e:
         return f"Неизвестная ошибка при получении статистики: {type(e).__name__} - {e}"
 
+# Фигура для plot_trend создаётся один раз и переиспользуется между вызовами
+_FIG, _AX = plt.subplots(figsize=(10, 6))
+
 # Инструмент: график по годам основания магазинов
 @tool
 def plot_trend(query: str) -> str:
@@ -108,43 +336,37 @@ def plot_trend(query: str) -> str:
         if not query or not isinstance(query, str):
             return "Ошибка: пустой или некорректный путь к файлу"
         
-        try:
-            df = pd.read_csv(query)
-        except UnicodeDecodeError:
-            df = pd.read_csv(query, encoding='latin1')
-        
-        if df.empty:
-            return f"Ошибка: файл '{query}' пустой."
-        
-        # Гибкий поиск столбцов
-        year_col = None
-        sales_col = None
-        for col in df.columns:
-            col_lower = col.lower()
-            if 'year' in col_lower and 'establish' in col_lower:
-                year_col = col
-            if 'sales' in col_lower or 'outlet_sales' in col_lower:
-                sales_col = col
+        # Сначала только заголовок, затем читаем лишь столбцы года и продаж
+        columns = _sniff_columns(query)
+        year_col, sales_col = _find_columns(columns)
         
         if not year_col:
-            return f"Ошибка: не найден столбец с годом основания. Доступные столбцы: {', '.join(df.columns)}"
+            return f"Ошибка: не найден столбец с годом основания. Доступные столбцы: {', '.join(columns)}"
         if not sales_col:
-            return f"Ошибка: не найден столбец с продажами. Доступные столбцы: {', '.join(df.columns)}"
+            return f"Ошибка: не найден столбец с продажами. Доступные столбцы: {', '.join(columns)}"
+        
+        df = load_dataframe(query, usecols=tuple(dict.fromkeys((year_col, sales_col))))
+        
+        if df.empty:
+            return f"Ошибка: файл '{query}' пустой."
         
-        sales_by_year = df.groupby(year_col)[sales_col].sum().sort_index()
+        # Лет основания немного, поэтому суммы по годам считаем через np.bincount вместо groupby
+        valid = df[year_col].notna().to_numpy()
+        years, year_codes = np.unique(df[year_col].to_numpy()[valid], return_inverse=True)
+        sales = np.nan_to_num(df[sales_col].to_numpy(dtype=np.float64)[valid])
+        sales_by_year = pd.Series(np.bincount(year_codes, weights=sales, minlength=len(years)), index=years)
         if sales_by_year.empty:
             return f"Ошибка: нет данных для построения графика после группировки."
         
-        plt.figure(figsize=(10, 6))
-        plt.bar(sales_by_year.index.astype(str), sales_by_year.values, color='#2E86AB')
-        plt.title('Суммарные продажи по годам основания магазинов', fontsize=14, fontweight='bold')
-        plt.xlabel('Год основания магазина')
-        plt.ylabel('Суммарные продажи')
-        plt.grid(True, alpha=0.3, axis='y')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig('sales_trend.png', dpi=150)
-        plt.close()
+        _AX.clear()
+        _AX.bar(sales_by_year.index.astype(str), sales_by_year.values, color='#2E86AB')
+        _AX.set_title('Суммарные продажи по годам основания магазинов', fontsize=14, fontweight='bold')
+        _AX.set_xlabel('Год основания магазина')
+        _AX.set_ylabel('Суммарные продажи')
+        _AX.grid(True, alpha=0.3, axis='y')
+        _AX.tick_params(axis='x', labelrotation=45)
+        _FIG.tight_layout()
+        _FIG.savefig('sales_trend.png', dpi=100)
         
         return (f"✅ График сохранён как 'sales_trend.png'.\n"
                 f"Диапазон лет: {sales_by_year.index.min()}–{sales_by_year.index.max()}\n"
@@ -172,62 +394,46 @@ def find_outliers(query: str) -> str:
         if not query or not isinstance(query, str):
             return "Ошибка: пустой или некорректный путь к файлу"
         
-        try:
-            df = pd.read_csv(query)
-        except UnicodeDecodeError:
-            df = pd.read_csv(query, encoding='latin1')
+        # Сначала только заголовок, затем читаем лишь столбец продаж
+        columns = _sniff_columns(query)
+        _, sales_col = _find_columns(columns)
         
-        if df.empty:
-            return f"Ошибка: файл '{query}' пустой."
+        if not sales_col:
+            return f"Ошибка: не найден столбец с продажами. Доступные столбцы: {', '.join(columns)}"
         
-        # Гибкий поиск столбца с продажами
-        sales_col = None
-        for col in df.columns:
-            col_lower = col.lower()
-            if 'sales' in col_lower or 'outlet_sales' in col_lower:
-                sales_col = col
-                break
+        df = load_dataframe(query, usecols=(sales_col,))
         
-        if not sales_col:
-            return f"Ошибка: не найден столбец с продажами. Доступные столбцы: {', '.join(df.columns)}"
+        if df.empty:
+            return f"Ошибка: файл '{query}' пустой."
         
         # Удаляем пропуски в столбце продаж
-        df_clean = df.dropna(subset=[sales_col])
-        if df_clean.empty:
+        sales = df[sales_col].dropna()
+        if sales.empty:
             return "Ошибка: все значения в столбце продаж отсутствуют (NaN)."
         
-        # Расчёт границ IQR
-        sales_values = df_clean[sales_col].values
-        q1 = np.percentile(sales_values, 25)
-        q3 = np.percentile(sales_values, 75)
-        iqr = q3 - q1
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        
-        # Фильтрация аномалий
-        outliers = df_clean[
-            (df_clean[sales_col] < lower_bound) | 
-            (df_clean[sales_col] > upper_bound)
-        ]
+        # Расчёт границ IQR и поиск аномалий
+        sales_values = sales.to_numpy(dtype=np.float64)
+        lower_bound, upper_bound, n_outliers, first_idx = _iqr_outlier_stats(sales_values)
         
         # Формирование ответа
-        if len(outliers) == 0:
+        if n_outliers == 0:
             return f"Аномалии не обнаружены. Все продажи находятся в диапазоне [{lower_bound:.2f}, {upper_bound:.2f}]."
         
         # Примеры аномалий (первые 3 записи)
-        examples = []
-        for idx, row in outliers.head(3).iterrows():
-            examples.append(f"- Запись #{idx}: {row[sales_col]:.2f}")
-        
+        examples = [
+            f"- Запись #{idx}: {value:.2f}"
+            for idx, value in zip(sales.index[first_idx], sales_values[first_idx])
+        ]
+
         examples_text = "\n".join(examples)
         
         return (
-            f"Найдено {len(outliers)} аномальных продаж вне диапазона [{lower_bound:.2f}, {upper_bound:.2f}].\n\n"
+            f"Найдено {n_outliers} аномальных продаж вне диапазона [{lower_bound:.2f}, {upper_bound:.2f}].\n\n"
             f"Примеры аномалий (первые 3 записи):\n{examples_text}\n\n"
             f"Бизнес-интерпретация:\n"
             f"- Высокие аномалии (> {upper_bound:.2f}): вероятно оптовые заказы или ошибки ввода (лишний ноль)\n"
             f"- Низкие аномалии (< {lower_bound:.2f}): возможны возвраты товара или технические ошибки\n"
-            f"Рекомендация: проверить {len(outliers)} записей вручную перед удалением из датасета."
+            f"Рекомендация: проверить {n_outliers} записей вручную перед удалением из датасета."
         )
     
     except FileNotFoundError:
@@ -251,21 +457,12 @@ def correlation_analysis(query: str) -> str:
         if not query or not isinstance(query, str):
             return "Ошибка: пустой или некорректный путь к файлу"
         
-        try:
-            df = pd.read_csv(query)
-        except UnicodeDecodeError:
-            df = pd.read_csv(query, encoding='latin1')
+        df = load_dataframe(query)
         
         if df.empty:
             return f"Ошибка: файл '{query}' пустой."
         
-        # Поиск столбца с продажами
-        sales_col = None
-        for col in df.columns:
-            col_lower = col.lower()
-            if 'sales' in col_lower or 'outlet_sales' in col_lower:
-                sales_col = col
-                break
+        _, sales_col = _find_columns(tuple(df.columns))
         
         if not sales_col:
             return f"Ошибка: не найден столбец с продажами. Доступные столбцы: {', '.join(df.columns)}"
@@ -277,12 +474,12 @@ def correlation_analysis(query: str) -> str:
         if not numeric_cols:
             numeric_report = "Числовых переменных для корреляции не найдено."
         else:
-            corr_matrix = df[numeric_cols + [sales_col]].corr()
-            correlations = []
-            for col in numeric_cols:
-                corr_value = corr_matrix.loc[col, sales_col]
-                if abs(corr_value) > 0.3:
-                    correlations.append((col, corr_value))
+            # Нужны только корреляции с продажами, а не вся матрица
+            corrs = pd.Series(
+                _corr_with(df[numeric_cols].to_numpy(dtype=np.float64), df[sales_col].to_numpy(dtype=np.float64)),
+                index=numeric_cols,
+            )
+            correlations = [(col, corr_value) for col, corr_value in corrs.items() if abs(corr_value) > 0.3]
             
             correlations.sort(key=lambda x: abs(x[1]), reverse=True)
             
@@ -297,20 +494,28 @@ def correlation_analysis(query: str) -> str:
                 numeric_report = "Сильных корреляций (|коэф| > 0.3) не обнаружено."
         
         # Анализ категориальных переменных
-        categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         categorical_cols = [col for col in categorical_cols if df[col].nunique() <= 50]
         
         if not categorical_cols:
             categorical_report = "Категориальных переменных для анализа не найдено."
         else:
             cat_analysis = []
+            sales_values = df[sales_col].to_numpy(dtype=np.float64)
+            has_sales = ~np.isnan(sales_values)
             for col in categorical_cols[:2]:
-                grouped = df.groupby(col)[sales_col].mean().sort_values(ascending=False)
-                top_categories = grouped.head(3).to_dict()
+                # Средние по категориям через factorize + bincount: категорий мало, groupby не нужен
+                codes, categories = pd.factorize(df[col])
+                valid = has_sales & (codes >= 0)
+                sums = np.bincount(codes[valid], weights=sales_values[valid], minlength=len(categories))
+                counts = np.bincount(codes[valid], minlength=len(categories))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    means = sums / counts
+                top = np.argsort(-means, kind='stable')[:3]
                 
                 cat_analysis.append(f"\nСредние продажи по '{col}':")
-                for cat, avg_sales in top_categories.items():
-                    cat_analysis.append(f"  • {cat}: {avg_sales:.2f} руб")
+                for i in top:
+                    cat_analysis.append(f"  • {categories[i]}: {means[i]:.2f} руб")
             
             categorical_report = "Анализ категориальных переменных:" + "".join(cat_analysis)
         
@@ -331,11 +536,13 @@ def correlation_analysis(query: str) -> str:
     except Exception as e:
         return f"Ошибка при корреляционном анализе: {type(e).__name__} - {e}"
 
-# Функция инициализации агента
+# Функция инициализации агента: граф неизменяемый, поэтому компилируется один раз на процесс
+@functools.cache
 def create_agent_executor():
-    llm = ChatOllama(model="llama3.1:8b", temperature=0, num_predict=250)
     tools = [load_csv, describe_data, plot_trend, find_outliers, correlation_analysis]
     tool_node = ToolNode(tools)
+    # Схемы инструментов привязываются к модели один раз, а не при каждом шаге графа
+    llm_with_tools = llm.bind_tools(tools)
     
     def should_continue(state: MessagesState):
         last = state["messages"][-1]
@@ -344,7 +551,7 @@ def create_agent_executor():
         return "__end__"
     
     builder = StateGraph(MessagesState)
-    builder.add_node("agent", lambda state: {"messages": [llm.bind_tools(tools).invoke(state["messages"])]})
+    builder.add_node("agent", lambda state: {"messages": [llm_with_tools.invoke(state["messages"])]})
     builder.add_node("tools", tool_node)
     builder.add_edge("agent", "tools")
     builder.add_conditional_edges("tools", should_continue)
@@ -352,4 +559,4 @@ def create_agent_executor():
     return builder.compile()
 
 # Экспортируем функции для использования в Streamlit
-__all__ = ["create_agent_executor", "find_outliers", "correlation_analysis", "plot_trend"]
\ No newline at end of file
+__all__ = ["create_agent_executor", "load_dataframe", "forget_file", "csv_to_feather", "find_outliers", "correlation_analysis", "plot_trend"]
\ No newline at end of file
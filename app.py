@@ -1,8 +1,10 @@
 import streamlit as st
-import pandas as pd
 import os
+import shutil
 import tempfile
-from agent_module import create_agent_executor, find_outliers, correlation_analysis, plot_trend
+import weakref
+from string import Template
+from agent_module import load_dataframe, forget_file, csv_to_feather, find_outliers, correlation_analysis, plot_trend
 
 # === Настройка страницы ===
 st.set_page_config(
@@ -13,21 +15,34 @@ st.set_page_config(
 )
 
 # === Тёмная фиолетовая тема ===
-st.markdown("""
+THEME = {
+    "background": "#1E1E1E",
+    "panel": "#2D2D2D",
+    "surface": "#3A3A3A",
+    "accent": "#B19CD9",
+    "accent_dark": "#9B59B6",
+    "text": "white",
+}
+
+# CSS описан один раз, цвета подставляются из палитры THEME;
+# подстановка кэшируется и не повторяется при каждом перезапуске скрипта
+@st.cache_data
+def theme_css():
+    return Template("""
 <style>
     /* Общий фон */
-    .main { background-color: #1E1E1E; color: white; }
+    .main { background-color: $background; color: $text; }
     
     /* Боковая панель */
-    .stSidebar { background-color: #2D2D2D; color: white; }
+    .stSidebar { background-color: $panel; color: $text; }
     
     /* Заголовки */
-    h1, h2, h3 { color: #B19CD9; }
+    h1, h2, h3 { color: $accent; }
     
     /* Кнопки */
     .stButton>button {
-        background: linear-gradient(135deg, #B19CD9, #9B59B6) !important;
-        color: white !important;
+        background: linear-gradient(135deg, $accent, $accent_dark) !important;
+        color: $text !important;
         border: none !important;
         border-radius: 8px !important;
         padding: 0.6rem 1.2rem !important;
@@ -36,50 +51,47 @@ st.markdown("""
     
     /* Метрики */
     .stMetric {
-        background-color: #3A3A3A !important;
-        color: white !important;
+        background-color: $surface !important;
+        color: $text !important;
         border-radius: 10px !important;
         padding: 1rem !important;
     }
     
     /* Загрузчик файлов */
     .stFileUploader>label {
-        color: #B19CD9 !important;
+        color: $accent !important;
         font-weight: bold !important;
     }
     .stFileUploader>div>div>button {
-        background: linear-gradient(135deg, #B19CD9, #9B59B6) !important;
-        color: white !important;
+        background: linear-gradient(135deg, $accent, $accent_dark) !important;
+        color: $text !important;
         border-radius: 8px !important;
         font-weight: bold !important;
     }
     
     /* Текст */
     .stMarkdown, .stText {
-        color: white !important;
+        color: $text !important;
     }
     
     /* Таблицы */
     [data-testid="stDataFrame"] {
-        background-color: #2D2D2D !important;
-        color: white !important;
+        background-color: $panel !important;
+        color: $text !important;
     }
     [data-testid="stDataFrame"] th {
-        background-color: #3A3A3A !important;
-        color: #B19CD9 !important;
+        background-color: $surface !important;
+        color: $accent !important;
     }
 </style>
-""", unsafe_allow_html=True)
+""").substitute(THEME)
+
+st.markdown(theme_css(), unsafe_allow_html=True)
 
 # === Заголовок ===
 st.title("💜 Агент-аналитик данных")
 st.markdown("Загрузи CSV-файл и получи автоматический анализ продаж")
 
-# === Инициализация агента ===
-if "agent_executor" not in st.session_state:
-    with st.spinner("🧠 Инициализация агента (первый запуск может занять 20-30 секунд)..."):
-        st.session_state.agent_executor = create_agent_executor()
-
 # === Боковая панель (только одна!) ===
 with st.sidebar:
     st.header("📁 Загрузка данных")
@@ -90,16 +102,60 @@ with st.sidebar:
     else:
         st.info("📎 Подсказка: используй датасет с Kaggle")
 
+# === Временный файл с загруженными данными ===
+# Файл живёт, пока не сменится загрузка: путь стабилен между перезапусками скрипта,
+# поэтому превью и инструменты берут один и тот же DataFrame из кэша agent_module.
+# Если вкладку просто закрыли, файл удаляет weakref.finalize: когда Streamlit освобождает
+# состояние завершённой сессии, либо при остановке сервера
+def remove_file(path):
+    forget_file(path)  # разобранный DataFrame удалённого файла больше не понадобится
+    if os.path.exists(path):
+        os.unlink(path)
+
+class UploadTempFile:
+    def __init__(self, path):
+        self.path = path
+        self._finalizer = weakref.finalize(self, remove_file, path)
+    
+    def discard(self):
+        self._finalizer()
+
+def discard_upload():
+    upload_file = st.session_state.pop("upload_file", None)
+    st.session_state.pop("upload_key", None)
+    st.session_state.pop("missing_count", None)
+    if upload_file is not None:
+        upload_file.discard()
+
 # === Основное окно ===
 if uploaded_file is not None:
     try:
-        # Сохраняем файл во временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
+        # file_id меняется при каждой новой загрузке, даже если имя и размер совпадают
+        upload_key = uploaded_file.file_id
+        if st.session_state.get("upload_key") != upload_key:
+            discard_upload()
+            # Сохраняем файл во временный файл
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
+                # Копируем порциями по 1 МБ, не создавая копию всего файла в памяти
+                uploaded_file.seek(0)
+                shutil.copyfileobj(uploaded_file, tmp_file, length=1 << 20)
             tmp_file_path = tmp_file.name
+            
+            # Конвертируем в Feather один раз, чтобы инструменты не разбирали CSV заново
+            try:
+                feather_path = csv_to_feather(tmp_file_path)
+            except Exception:
+                pass  # Arrow не смог сохранить данные — работаем с исходным CSV
+            else:
+                os.unlink(tmp_file_path)
+                tmp_file_path = feather_path
+            
+            st.session_state.upload_key = upload_key
+            st.session_state.upload_file = UploadTempFile(tmp_file_path)
+        tmp_file_path = st.session_state.upload_file.path
         
         # Загружаем данные
-        df = pd.read_csv(tmp_file_path)
+        df = load_dataframe(tmp_file_path)
         
         # Метрики
         col1, col2, col3 = st.columns(3)
@@ -108,8 +164,10 @@ if uploaded_file is not None:
         with col2:
             st.metric("📋 Столбцы", len(df.columns))
         with col3:
-            missing = df.isnull().sum().sum()
-            st.metric("🔍 Пропуски", missing)
+            # Пропуски считаются один раз на загрузку, а не при каждом перезапуске скрипта
+            if "missing_count" not in st.session_state:
+                st.session_state.missing_count = int(df.isna().to_numpy().sum())
+            st.metric("🔍 Пропуски", st.session_state.missing_count)
         
         # Превью данных
         st.subheader("👀 Превью данных")
@@ -150,12 +208,10 @@ if uploaded_file is not None:
                 if os.path.exists("sales_trend.png"):
                     st.image("sales_trend.png", caption="Продажи по годам основания магазинов", use_container_width=True)
         
-        # Удаляем временный файл
-        os.unlink(tmp_file_path)
-        
     except Exception as e:
         st.error(f"❌ Ошибка при анализе: {e}")
 else:
+    discard_upload()
     st.info("👈 Загрузи CSV-файл через боковую панель, чтобы начать анализ")
     
     st.subheader("💡 Возможности агента")